@@ -0,0 +1,54 @@
+"""Compare the throughput of the available hash backends, for both the
+small line ranges stored in the line cache and for whole files.
+
+Run from the repository root:
+
+    $ python benchmarks/digest_throughput.py
+
+"""
+
+import os.path
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from covexclude import digest  # noqa
+
+RANGE_COUNT = 10000
+FILE_SIZE = 16 * 1024 * 1024
+
+
+def measure(function, inputs, repeat=5):
+    """Best throughput in MB/s of hashing all inputs once"""
+    total_size = sum(len(data) for data in inputs)
+
+    def run():
+        for data in inputs:
+            function(data)
+
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+
+    return total_size / best / (1024 * 1024)
+
+
+def main():
+    ranges = [
+        ''.join('    value_{0} = compute({0})\n'.format(i + j)
+                for j in range(i % 7 + 1)).encode('utf-8')
+        for i in range(RANGE_COUNT)
+    ]
+    files = [os.urandom(FILE_SIZE)]
+
+    print('{:<10} {:>14} {:>14}'.format(
+        'backend', 'ranges MB/s', 'files MB/s'))
+
+    for name in digest.available_backends():
+        function = digest.backend(name)
+
+        print('{:<10} {:>14.1f} {:>14.1f}'.format(
+            name, measure(function, ranges), measure(function, files)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import json
+import os
+import os.path
+
+from .compat import IO_ERRORS, RawConfigParser
+
+# Files pytest reads its ini options from, in order of precedence, along
+# with the sections it reads them from
+INI_FILES = [
+    ('pytest.ini', ('pytest', )),
+    ('tox.ini', ('pytest', )),
+    ('setup.cfg', ('tool:pytest', 'pytest')),
+]
+
+# Default cache directories of pytest 3.4 and later, and of earlier
+# versions
+DEFAULT_CACHE_DIRS = ['.pytest_cache', '.cache']
+
+
+def default_cache_dir(rootdir='.'):
+    """Locate pytest's cache directory for the project in rootdir.
+
+    This is the cache_dir ini option when it is set, and otherwise the
+    default directory of whichever pytest version created one.
+
+    """
+    for filename, sections in INI_FILES:
+        parser = RawConfigParser()
+        parser.read(os.path.join(rootdir, filename))
+
+        section = next((s for s in sections if parser.has_section(s)), None)
+
+        if section is None:
+            continue
+
+        if parser.has_option(section, 'cache_dir'):
+            return os.path.join(
+                rootdir,
+                os.path.expandvars(parser.get(section, 'cache_dir')))
+
+        break
+
+    for cache_dir in DEFAULT_CACHE_DIRS:
+        if os.path.isdir(os.path.join(rootdir, cache_dir)):
+            return os.path.join(rootdir, cache_dir)
+
+    return os.path.join(rootdir, DEFAULT_CACHE_DIRS[0])
+
+
+def value_path(cache_dir, key):
+    """Path of the file pytest's cache stores the given key in"""
+    return os.path.join(cache_dir, 'v', *key.split('/'))
+
+
+def read(cache_dir, key, default):
+    """Read a value from pytest's cache directory without going through a
+    pytest session.
+
+    """
+    try:
+        with open(value_path(cache_dir, key), 'r') as f:
+            return json.load(f)
+    except IO_ERRORS + (ValueError,):
+        return default
+
+
+def write(cache_dir, key, value):
+    """Write a value to pytest's cache directory, in the same format as
+    pytest itself.
+
+    """
+    path = value_path(cache_dir, key)
+
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    with open(path, 'w') as f:
+        json.dump(value, f, indent=2, sort_keys=True)
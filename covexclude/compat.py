@@ -1,4 +1,9 @@
 try:
     IO_ERRORS = (FileNotFoundError, NotADirectoryError)
 except NameError:
-    IO_ERRORS = IOError
+    IO_ERRORS = (IOError, )
+
+try:
+    from configparser import RawConfigParser
+except ImportError:
+    from ConfigParser import RawConfigParser
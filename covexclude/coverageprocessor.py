@@ -1,11 +1,20 @@
+import bisect
 import codecs
+import collections
 
 from .compat import IO_ERRORS
 
+# lines: the file's lines, without their trailing line terminator
+# next_non_blank: for each line index (plus one past EOF), the index of
+# the first line at or after it that is not blank
+FileContents = collections.namedtuple(
+    'FileContents', ['lines', 'next_non_blank'])
 
-def determine_non_measured_lines(coverage_data, line_cache):
+
+def determine_non_measured_lines(coverage_data, filenames, line_cache):
     """Given some coverage data and the line cache, determine which lines
-    in which files need to be looked up by scanning the file itself.
+    in which of the given files need to be looked up by scanning the file
+    itself.
 
     Returns a tuple:
     - A list of line cache keys that already have been scanned and
@@ -18,30 +27,26 @@ def determine_non_measured_lines(coverage_data, line_cache):
     indices = []
     non_measured_lines = {}
 
-    for filename in coverage_data.measured_files():
+    for filename in filenames:
         filename_index = line_cache.filename_index(filename)
-        lines = [i - 1 for i in list(sorted(coverage_data.lines(filename)))]
+        lines = sorted(i - 1 for i in coverage_data.lines(filename))
         actual_lines = []
 
-        next_end = None
-        for start in lines:
-            if next_end is not None and start >= next_end:
-                next_end = None
-
-            if next_end is None:
-                key, record = line_cache.match_record(
-                    filename_index, start)
+        i = 0
+        n_lines = len(lines)
+        while i < n_lines:
+            start = lines[i]
+            key, record = line_cache.match_record(filename_index, start)
 
-                if record is not None:
-                    indices.append(key)
-                    _, _, next_end, _ = record
-                else:
-                    actual_lines.append(start)
+            if record is not None:
+                indices.append(key)
+                _, _, next_end, _ = record
 
+                # Skip every covered line already included in the record
+                i = bisect.bisect_left(lines, next_end, i + 1)
             else:
-                if start >= next_end:
-                    actual_lines.append(start)
-                    next_end = None
+                actual_lines.append(start)
+                i += 1
 
         non_measured_lines[filename] = actual_lines
 
@@ -50,19 +55,35 @@ def determine_non_measured_lines(coverage_data, line_cache):
 
 def add_to_cache(filename, file_contents_cache):
     if filename not in file_contents_cache:
-        successful = False
+        all_lines = []
 
         for encoding in ['utf-8', 'latin_1']:
             try:
                 with codecs.open(filename, 'r', encoding=encoding) as f:
-                    file_contents_cache[filename] = f.readlines()
-                    successful = True
+                    all_lines = f.readlines()
                     break
             except UnicodeDecodeError:
                 pass
 
-        if not successful:
-            file_contents_cache[filename] = []
+        file_contents_cache[filename] = _scan_lines(all_lines)
+
+
+def _scan_lines(all_lines):
+    """Strip the line terminators and precompute the blank line table used
+    by get_lines_in_file, so that it only has to be built once per file
+    instead of once per test.
+
+    """
+    lines = [l[:-1] for l in all_lines]
+
+    next_non_blank = [len(lines)] * (len(lines) + 1)
+    for i in range(len(lines) - 1, -1, -1):
+        if lines[i].strip() == '':
+            next_non_blank[i] = next_non_blank[i + 1]
+        else:
+            next_non_blank[i] = i
+
+    return FileContents(lines, next_non_blank)
 
 
 def get_lines_in_file(filename, line_numbers, file_contents_cache):
@@ -88,41 +109,40 @@ def get_lines_in_file(filename, line_numbers, file_contents_cache):
     changes made in the whitespace in between executed lines.
 
     """
-    lines = []
-    line_numbers = frozenset(line_numbers)
-    added_previous_line = False
-
     try:
         add_to_cache(filename, file_contents_cache)
     except IO_ERRORS:
         return []
 
-    all_lines = file_contents_cache[filename]
-    run_start = 0
-    current_run_lines = []
-    for i, l in enumerate(all_lines):
-        l = l[:-1]
-        if i in line_numbers:
-            if not added_previous_line:
-                run_start = i
-            current_run_lines.append(l)
-            added_previous_line = True
-
-        elif added_previous_line and l.strip() == '':
-            current_run_lines.append(l)
-            added_previous_line = True
-
-        elif current_run_lines:
-            lines.append((run_start, i, '\n'.join(current_run_lines)))
-            added_previous_line = False
-            current_run_lines = []
+    all_lines, next_non_blank = file_contents_cache[filename]
+    n_lines = len(all_lines)
+    line_numbers = sorted(
+        i for i in frozenset(line_numbers) if 0 <= i < n_lines)
 
-        else:
-            added_previous_line = False
+    lines = []
+    i = 0
+    while i < len(line_numbers):
+        run_start = line_numbers[i]
+        run_end = run_start + 1
+        i += 1
+
+        # Extend the run over trailing whitespace, and over any covered
+        # lines that directly follow it
+        while True:
+            run_end = next_non_blank[run_end]
+
+            if i < len(line_numbers) and line_numbers[i] <= run_end:
+                run_end = line_numbers[i] + 1
+                i += 1
+            else:
+                break
+
+        current_run_lines = all_lines[run_start:run_end]
+
+        # Add EOF marker
+        if run_end == n_lines:
+            current_run_lines = current_run_lines + ['']
 
-    # Add EOF marker
-    if added_previous_line:
-        current_run_lines.append('')
-        lines.append((run_start, i + 1, '\n'.join(current_run_lines)))
+        lines.append((run_start, run_end, '\n'.join(current_run_lines)))
 
     return lines
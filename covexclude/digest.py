@@ -0,0 +1,65 @@
+import hashlib
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+AUTO = 'auto'
+
+# Short digests are plenty for detecting changes, and keep the cache
+# small
+DIGEST_SIZE = 8
+
+
+def _xxh3(data):
+    return xxhash.xxh3_64_hexdigest(data)
+
+
+def _blake2b(data):
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).hexdigest()
+
+
+def _md5(data):
+    return hashlib.new('md5', data).hexdigest()
+
+
+# [(name, function from bytes to a hex digest, is available)], in order
+# of preference
+BACKENDS = [
+    ('xxh3', _xxh3, xxhash is not None and
+     hasattr(xxhash, 'xxh3_64_hexdigest')),
+    ('blake2b', _blake2b, hasattr(hashlib, 'blake2b')),
+    ('md5', _md5, True),
+]
+
+
+def available_backends():
+    return [name for name, _, available in BACKENDS if available]
+
+
+def resolve(name):
+    """Resolve a configured backend name, where "auto" picks the fastest
+    one available.
+
+    """
+    available = available_backends()
+
+    if name == AUTO:
+        return available[0]
+
+    if name not in available:
+        raise ValueError(
+            'Unknown or unavailable hash backend {!r}, expected one of: {}'
+            .format(name, ', '.join([AUTO] + available)))
+
+    return name
+
+
+def backend(name):
+    """Return the hash function of the given backend"""
+    name = resolve(name)
+
+    for backend_name, function, _ in BACKENDS:
+        if backend_name == name:
+            return function
@@ -1,3 +1,5 @@
+import threading
+
 from . import linecache
 from .compat import IO_ERRORS
 from .coverageprocessor import (add_to_cache,
@@ -5,41 +7,117 @@ from .coverageprocessor import (add_to_cache,
                                 get_lines_in_file)
 
 FAILED_TESTS_KEY = 'failed_tests'
-RECORDED_LINES_KEY = 'recorded_lines'
+PROFILES_KEY = 'profiles'
+RECORDED_PROFILES_KEY = 'recorded_profiles'
+SESSION_TESTS_KEY = 'session_tests'
+DURATIONS_KEY = 'durations'
 
 
 class Driver:
-    def __init__(self, line_cache, file_hash_cache, initial_data):
+    def __init__(self, line_cache, file_hash_cache, distribution_cache,
+                 initial_data):
         self.file_contents_cache = {}
 
         self.previously_failed_tests = frozenset()
         self.failed_tests = set()
 
-        self.previously_recorded_lines = {}
-        self.recorded_lines = {}
+        # A profile is everything a test depends on: a tuple of sorted
+        # line cache keys and a tuple of sorted distribution names. Tests
+        # with identical dependencies, such as the cases of a
+        # parametrized test, share a single profile.
+        #
+        # [(keys, distribution names)]
+        self.previous_profiles = []
+
+        # item_id => index into previous_profiles
+        self.previously_recorded_profiles = {}
+
+        # item_id => profile
+        self.recorded_profiles = {}
+
+        # Tests that were recorded in the previous session, rather than
+        # carried over from earlier ones
+        self.previous_session_tests = frozenset()
+
+        # profile index => whether tests using it need to be executed
+        self.profile_results = {}
+
+        # item_id => seconds spent in setup, call and teardown
+        self.previous_durations = {}
+        self.durations = {}
 
         self.line_cache = line_cache
         self.file_hash_cache = file_hash_cache
+        self.distribution_cache = distribution_cache
+
+        self.prefetch_thread = None
 
         if initial_data:
             self.previously_failed_tests = frozenset(
                 initial_data.get(FAILED_TESTS_KEY, []))
 
-            self.previously_recorded_lines = initial_data.get(
-                RECORDED_LINES_KEY, {})
+            self.previous_profiles = [
+                (tuple(keys), tuple(names))
+                for keys, names in initial_data.get(PROFILES_KEY, [])
+            ]
+
+            self.previously_recorded_profiles = initial_data.get(
+                RECORDED_PROFILES_KEY, {})
+
+            self.previous_session_tests = frozenset(
+                initial_data.get(SESSION_TESTS_KEY, []))
+
+            self.previous_durations = initial_data.get(DURATIONS_KEY, {})
+
+    def prefetch(self, filenames):
+        """Start hashing the given files in a background thread, and read
+        the contents of the ones that have changed since the last run.
+
+        This lets the work overlap with pytest's collection phase, so the
+        data is ready once should_execute_item needs it.
+
+        """
+        filenames = list(filenames)
+
+        def run():
+            self.file_hash_cache.hash_missing_files(filenames)
+
+            for filename in filenames:
+                if self.file_hash_cache.is_identical(filename):
+                    continue
+
+                try:
+                    add_to_cache(filename, self.file_contents_cache)
+                except IO_ERRORS:
+                    continue
+
+        self.prefetch_thread = threading.Thread(target=run)
+        self.prefetch_thread.daemon = True
+        self.prefetch_thread.start()
+
+    def wait_for_prefetch(self):
+        if self.prefetch_thread is not None:
+            self.prefetch_thread.join()
+            self.prefetch_thread = None
 
     def cache_files_from_coverage(self, coverage_data):
-        for filename in coverage_data.measured_files():
+        filenames, _ = self._split_by_distribution(
+            coverage_data.measured_files())
+
+        for filename in filenames:
             try:
                 add_to_cache(filename, self.file_contents_cache)
             except IO_ERRORS:
                 continue
 
-        self.file_hash_cache.hash_missing_files(coverage_data.measured_files())
+        self.file_hash_cache.hash_missing_files(filenames)
+
+    def report_test_coverage(self, item_id, coverage_data, opened_files=()):
+        filenames, distributions = self._split_by_distribution(
+            coverage_data.measured_files())
 
-    def report_test_coverage(self, item_id, coverage_data):
         indices, non_measured_lines = determine_non_measured_lines(
-            coverage_data, self.line_cache)
+            coverage_data, filenames, self.line_cache)
 
         test_lines = {
             filename: get_lines_in_file(
@@ -57,53 +135,159 @@ class Driver:
                     self.line_cache.save_record(
                         filename_index, start, end, content))
 
-        assert item_id not in self.recorded_lines
-        self.recorded_lines[item_id] = indices
+        # Non-Python files read by the test are tracked as a whole,
+        # through their file hash
+        self.file_hash_cache.hash_missing_files(opened_files)
+
+        for filename in opened_files:
+            indices.append(
+                self.line_cache.save_file_record(
+                    self.line_cache.filename_index(filename)))
+
+        assert item_id not in self.recorded_profiles
+        self.recorded_profiles[item_id] = (
+            tuple(sorted(set(indices))),
+            tuple(sorted(distributions)))
 
     def report_test_failure(self, item_id):
         self.failed_tests.add(item_id)
 
+    def report_test_duration(self, item_id, duration):
+        self.durations[item_id] = self.durations.get(item_id, 0) + duration
+
     def should_execute_item(self, item_id, known_identical_items):
-        if item_id not in self.previously_recorded_lines:
+        self.wait_for_prefetch()
+
+        if item_id not in self.previously_recorded_profiles:
             return True
 
         if item_id in self.previously_failed_tests:
             return True
 
-        old_file_data = self.previously_recorded_lines[item_id]
+        profile_index = self.previously_recorded_profiles[item_id]
 
-        for key in old_file_data:
-            if key in known_identical_items:
-                continue
+        if profile_index not in self.profile_results:
+            self.profile_results[profile_index] = self._is_profile_changed(
+                self.previous_profiles[profile_index],
+                known_identical_items)
 
-            filename_index, start, end, content = self.line_cache.lookup(key)
-            filename = self.line_cache.filenames[filename_index]
+        return self.profile_results[profile_index]
 
-            if self.file_hash_cache.is_identical(filename):
-                known_identical_items.add(key)
-                continue
+    def _is_profile_changed(self, profile, known_identical_items):
+        keys, distributions = profile
 
-            new_line_data = get_lines_in_file(
-                filename,
-                range(start, end),
-                self.file_contents_cache)
-
-            if len(new_line_data) != 1:
+        for name in distributions:
+            if not self.distribution_cache.is_identical(name):
                 return True
 
-            _, _, expected_content = new_line_data[0]
+        for key in keys:
+            if key in known_identical_items:
+                continue
 
-            if content != linecache.hash(expected_content):
+            if self.is_range_changed(key):
                 return True
 
+            known_identical_items.add(key)
+
         return False
 
+    def is_range_changed(self, key):
+        filename_index, start, end, content = self.line_cache.lookup(key)
+        filename = self.line_cache.filenames[filename_index]
+
+        if self.file_hash_cache.is_identical(filename):
+            return False
+
+        if start == linecache.WHOLE_FILE:
+            return True
+
+        new_line_data = get_lines_in_file(
+            filename,
+            range(start, end),
+            self.file_contents_cache)
+
+        if len(new_line_data) != 1:
+            return True
+
+        _, _, expected_content = new_line_data[0]
+
+        return content != self.line_cache.hash(expected_content)
+
+    def forget_files(self, filenames):
+        """Drop the cached contents and hashes of the given files, so that
+        they are read again the next time they are needed.
+
+        """
+        for filename in filenames:
+            self.file_contents_cache.pop(filename, None)
+
+        self.file_hash_cache.forget_files(filenames)
+
+    def merged_profiles(self):
+        """Map each recorded test, from this session or earlier ones, to its
+        profile.
+
+        """
+        profiles = {
+            item_id: self.previous_profiles[profile_index]
+            for item_id, profile_index
+            in self.previously_recorded_profiles.items()
+        }
+        profiles.update(self.recorded_profiles)
+
+        return profiles
+
+    def merged_durations(self):
+        durations = {}
+        durations.update(self.previous_durations)
+        durations.update(self.durations)
+
+        return durations
+
+    def distribution_names(self):
+        """All distributions used by any recorded test"""
+        names = set()
+
+        for _, distributions in self.merged_profiles().values():
+            names.update(distributions)
+
+        return names
+
     def to_json(self):
-        line_data = {}
-        line_data.update(self.previously_recorded_lines)
-        line_data.update(self.recorded_lines)
+        profiles = []
+        profile_indices = {}
+        recorded_profiles = {}
+
+        for item_id, profile in self.merged_profiles().items():
+            if profile not in profile_indices:
+                profile_indices[profile] = len(profiles)
+                profiles.append(profile)
+
+            recorded_profiles[item_id] = profile_indices[profile]
 
         return {
             FAILED_TESTS_KEY: list(self.failed_tests),
-            RECORDED_LINES_KEY: line_data,
+            PROFILES_KEY: profiles,
+            RECORDED_PROFILES_KEY: recorded_profiles,
+            SESSION_TESTS_KEY: sorted(self.recorded_profiles),
+            DURATIONS_KEY: self.merged_durations(),
         }
+
+    def _split_by_distribution(self, filenames):
+        """Split measured files into the ones that need to be tracked line
+        by line, and the names of the installed distributions owning the
+        rest.
+
+        """
+        own_filenames = []
+        distributions = set()
+
+        for filename in filenames:
+            name = self.distribution_cache.distribution_for(filename)
+
+            if name is None:
+                own_filenames.append(filename)
+            else:
+                distributions.add(name)
+
+        return own_filenames, distributions
@@ -0,0 +1,194 @@
+import hashlib
+import os.path
+import platform
+import site
+import sysconfig
+
+
+def fingerprint(variable_names):
+    """Describe the parts of the environment that can affect any test:
+    the interpreter, and the values of the given environment variables.
+
+    Variable values are stored as hashes, since they may hold
+    credentials and the fingerprint is written to the cache.
+
+    """
+    return {
+        'python': '{} {}'.format(platform.python_implementation(),
+                                 platform.python_version()),
+        'variables': {
+            name: _hash_value(os.environ.get(name))
+            for name in variable_names
+        },
+    }
+
+
+def _hash_value(value):
+    if value is None:
+        return None
+
+    return hashlib.new('sha256', value.encode('utf-8')).hexdigest()
+
+
+class DistributionCache:
+    """Tracks which installed distribution owns each file in
+    site-packages, so that tests can depend on the version of a
+    distribution rather than on the contents of its files.
+
+    Versions are read from the distribution metadata, and include a hash
+    of the distribution's RECORD file when there is one. This makes
+    reinstalling a modified package with an unchanged version number
+    count as a change too.
+
+    Distribution tracking needs importlib.metadata. Without it, no file
+    is considered to be owned by a distribution.
+
+    """
+
+    def __init__(self, initial_data):
+        # distribution name => version
+        self.versions = {}
+
+        self.previous_versions = {}
+
+        if initial_data:
+            self.previous_versions = dict(initial_data)
+
+        # filename => distribution name or None
+        self.file_owners = {}
+
+        # Loaded on first use by _load_distributions
+        self.site_directories = None
+        self.top_level_owners = None
+        self.distributions = None
+
+    def distribution_for(self, filename):
+        if filename not in self.file_owners:
+            self.file_owners[filename] = self._find_owner(filename)
+
+        return self.file_owners[filename]
+
+    def is_identical(self, name):
+        old_version = self.previous_versions.get(name)
+        new_version = self._version(name)
+
+        return old_version and new_version and old_version == new_version
+
+    def to_json(self, names):
+        return {
+            name: self._version(name)
+            for name in names
+            if self._version(name)
+        }
+
+    def _find_owner(self, filename):
+        self._load_distributions()
+
+        for site_directory in self.site_directories:
+            if filename.startswith(site_directory):
+                relative_path = filename[len(site_directory):]
+                top_level = _top_level_name(relative_path.split(os.sep)[0])
+
+                return self.top_level_owners.get(top_level)
+
+        return None
+
+    def _version(self, name):
+        if name not in self.versions:
+            self._load_distributions()
+            self.versions[name] = _distribution_version(
+                self.distributions.get(name))
+
+        return self.versions[name]
+
+    def _load_distributions(self):
+        if self.distributions is not None:
+            return
+
+        self.site_directories = _site_directories()
+        self.top_level_owners = {}
+        self.distributions = {}
+
+        importlib_metadata = _import_metadata()
+        if importlib_metadata is None:
+            return
+
+        for dist in importlib_metadata.distributions():
+            name = dist.metadata['Name']
+
+            # Only the first distribution on sys.path with a given name
+            # is importable
+            if not name or name in self.distributions:
+                continue
+
+            self.distributions[name] = dist
+
+            for top_level in _top_level_names(dist):
+                if self.top_level_owners.get(top_level, name) != name:
+                    # Namespace packages are shared between several
+                    # distributions, so their files can't be attributed
+                    # to a single one
+                    self.top_level_owners[top_level] = None
+                else:
+                    self.top_level_owners[top_level] = name
+
+
+def _import_metadata():
+    # importlib.metadata is imported lazily since it is slow to import,
+    # and only needed once a test touches a file in site-packages
+    try:
+        from importlib import metadata
+    except ImportError:
+        return None
+
+    return metadata
+
+
+def _site_directories():
+    directories = set()
+
+    paths = sysconfig.get_paths()
+    directories.update([paths['purelib'], paths['platlib']])
+
+    if hasattr(site, 'getsitepackages'):
+        directories.update(site.getsitepackages())
+
+    if hasattr(site, 'getusersitepackages'):
+        directories.add(site.getusersitepackages())
+
+    return [os.path.join(os.path.abspath(d), '') for d in directories]
+
+
+def _top_level_names(dist):
+    top_level = dist.read_text('top_level.txt')
+
+    if top_level is not None:
+        return set(_top_level_name(l.split('/')[0])
+                   for l in top_level.split())
+
+    return set(
+        _top_level_name(f.parts[0])
+        for f in dist.files or []
+        if f.parts and f.parts[0] not in ('..', '__pycache__') and
+        not f.parts[0].endswith(('.dist-info', '.egg-info'))
+    )
+
+
+def _top_level_name(path_component):
+    # Strip extensions, including those of compiled modules such as
+    # "_speedups.cpython-35m-x86_64-linux-gnu.so"
+    return path_component.split('.')[0]
+
+
+def _distribution_version(dist):
+    if dist is None:
+        return None
+
+    record = dist.read_text('RECORD')
+
+    if record is None:
+        return dist.version
+
+    return '{}:{}'.format(
+        dist.version,
+        hashlib.new('md5', record.encode('utf-8')).hexdigest())
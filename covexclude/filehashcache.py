@@ -1,11 +1,12 @@
-import hashlib
 import os.path
 
 from .compat import IO_ERRORS
 
 
 class FileHashCache:
-    def __init__(self, initial_data):
+    def __init__(self, initial_data, hash_function):
+        self.hash_function = hash_function
+
         self.file_hashes = {}
 
         self.previous_file_hashes = {}
@@ -17,15 +18,22 @@ class FileHashCache:
             }
 
     def hash_missing_files(self, filenames):
-        self.file_hashes.update({
-            filename: _hash_file(filename)
-            for filename in filenames
-            if filename not in self.file_hashes
-        })
+        # Store each hash as soon as it is computed, so that a prefetch
+        # running in the background makes progress visible to the
+        # main thread
+        for filename in filenames:
+            if filename not in self.file_hashes:
+                self.file_hashes[filename] = _hash_file(
+                    filename, self.hash_function)
+
+    def forget_files(self, filenames):
+        for filename in filenames:
+            self.file_hashes.pop(filename, None)
 
     def is_identical(self, filename):
         if filename not in self.file_hashes:
-            self.file_hashes[filename] = _hash_file(filename)
+            self.file_hashes[filename] = _hash_file(
+                filename, self.hash_function)
 
         old_hash = self.previous_file_hashes.get(filename)
         new_hash = self.file_hashes[filename]
@@ -39,11 +47,9 @@ class FileHashCache:
         }
 
 
-def _hash_file(filename):
+def _hash_file(filename, hash_function):
     try:
         with open(filename, 'rb') as f:
-            return hashlib \
-                .new('sha1', f.read()) \
-                .hexdigest()
+            return hash_function(f.read())
     except IO_ERRORS:
         return None
@@ -0,0 +1,114 @@
+import os.path
+import sys
+import threading
+
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+# Python sources are already tracked through coverage data, line by line
+IGNORED_EXTENSIONS = frozenset(['.py', '.pyc', '.pyo'])
+
+# The recorder currently recording, if any
+_current_recorder = None
+_hook_installed = False
+
+
+class FileRecorder:
+    """Records the files opened for reading while a test is running, so
+    that they can be tracked as dependencies of the test.
+
+    Only regular files within the root directory, opened from the thread
+    that started recording, are recorded. Files opened for writing are
+    skipped, since they are outputs rather than inputs of the test.
+
+    """
+
+    def __init__(self, root):
+        self.root = os.path.join(os.path.abspath(root), '')
+        self.opened_files = None
+        self.thread = None
+
+    def start(self):
+        global _current_recorder
+
+        _install_hook()
+
+        self.opened_files = set()
+        self.thread = threading.current_thread()
+        _current_recorder = self
+
+    def stop(self):
+        global _current_recorder
+
+        _current_recorder = None
+        opened_files, self.opened_files = self.opened_files, None
+        self.thread = None
+
+        return sorted(
+            f for f in opened_files
+            if f.startswith(self.root) and
+            os.path.splitext(f)[1] not in IGNORED_EXTENSIONS and
+            os.path.isfile(f)
+        )
+
+    def record(self, path, mode, flags):
+        # Other threads, such as the driver's prefetch, aren't part of
+        # the test
+        if threading.current_thread() is not self.thread:
+            return
+
+        if isinstance(path, bytes) and not isinstance(path, str):
+            path = path.decode(sys.getfilesystemencoding())
+
+        if not isinstance(path, (type(''), type(u''))):
+            # File descriptors and path-like objects we can't resolve
+            return
+
+        if mode is None:
+            # os.open only passes flags
+            if flags & (os.O_WRONLY | os.O_RDWR):
+                return
+        elif 'r' not in mode or '+' in mode:
+            return
+
+        self.opened_files.add(os.path.abspath(path))
+
+
+def _install_hook():
+    global _hook_installed
+
+    if _hook_installed:
+        return
+
+    _hook_installed = True
+
+    if hasattr(sys, 'addaudithook'):
+        sys.addaudithook(_audit_hook)
+    else:
+        _wrap_builtin_open()
+
+
+def _audit_hook(event, args):
+    recorder = _current_recorder
+
+    if event == 'open' and recorder is not None:
+        path, mode, flags = args
+        recorder.record(path, mode, flags)
+
+
+def _wrap_builtin_open():
+    # Audit hooks are only available from Python 3.8 and up, so fall back
+    # to intercepting calls to the builtin open function
+    original_open = builtins.open
+
+    def open(file, mode='r', *args, **kwargs):
+        recorder = _current_recorder
+
+        if recorder is not None:
+            recorder.record(file, mode, 0)
+
+        return original_open(file, mode, *args, **kwargs)
+
+    builtins.open = open
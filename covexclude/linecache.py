@@ -1,24 +1,37 @@
-import hashlib
 import os.path
 
 FILENAMES_KEY = 'filenames'
 RECORDED_RANGES_KEY = 'recorded_ranges'
 
+# Start and end of records that track a whole file rather than a range
+# of lines within it
+WHOLE_FILE = -1
+
 
 class LineCache:
-    def __init__(self, initial_data):
+    def __init__(self, initial_data, hash_function):
+        self.hash_function = hash_function
+
         # [filename]
         self.filenames = []
 
         # filename => index
         self.filename_indices = {}
 
-        # [(filename_index, start, end, md5(content))]
+        # [(filename_index, start, end, hash(content))]
+        #
+        # Whole file records use WHOLE_FILE as start and end, and None as
+        # content, since they rely on the file hash alone
         self.recorded_ranges = []
 
         # (filename, start) => index
         self.range_indices = {}
 
+        # (filename, start, end, hash(content)) => index, for records that
+        # conflict with the one in range_indices. They can only be reached
+        # through their index, see merge_hashed_record
+        self.conflicting_indices = {}
+
         if initial_data:
             self.filenames = [os.path.abspath(f) for f in initial_data[FILENAMES_KEY]]
             self.recorded_ranges = initial_data[RECORDED_RANGES_KEY]
@@ -30,12 +43,18 @@ class LineCache:
                 self.range_indices[n, s] = i
 
     def save_record(self, filename_index, start, end, content):
-        hashed_content = hash(content)
+        return self.save_hashed_record(
+            filename_index, start, end, self.hash(content))
 
+    def save_file_record(self, filename_index):
+        return self.save_hashed_record(
+            filename_index, WHOLE_FILE, WHOLE_FILE, None)
+
+    def save_hashed_record(self, filename_index, start, end, hashed_content):
         t = (filename_index, start)
 
         if t not in self.range_indices:
-            i = len(self.range_indices)
+            i = len(self.recorded_ranges)
             self.recorded_ranges.append(t + (end, hashed_content, ))
             self.range_indices[t] = i
         else:
@@ -47,6 +66,28 @@ class LineCache:
 
         return self.range_indices[t]
 
+    def merge_hashed_record(self, filename_index, start, end, hashed_content):
+        """Like save_hashed_record, but for records coming from different
+        sessions. Those may cover different ranges starting at the same
+        line, since a range ends where the first test to record it stopped
+        covering lines. A conflicting record is kept as a separate record
+        that is only used through the returned index.
+
+        """
+        i, record = self.match_record(filename_index, start)
+
+        if record is None or tuple(record[2:]) == (end, hashed_content):
+            return self.save_hashed_record(
+                filename_index, start, end, hashed_content)
+
+        t = (filename_index, start, end, hashed_content)
+
+        if t not in self.conflicting_indices:
+            self.conflicting_indices[t] = len(self.recorded_ranges)
+            self.recorded_ranges.append(t)
+
+        return self.conflicting_indices[t]
+
     def lookup(self, key):
         return self.recorded_ranges[key]
 
@@ -66,14 +107,12 @@ class LineCache:
 
         return self.filename_indices[filename]
 
+    def hash(self, content):
+        return self.hash_function(content.encode('utf-8'))
+
     def to_json(self):
         return {
             FILENAMES_KEY: [os.path.relpath(f) for f in self.filenames],
             RECORDED_RANGES_KEY: self.recorded_ranges,
         }
 
-
-def hash(content):
-    return hashlib \
-        .new('md5', content.encode('utf-8')) \
-        .hexdigest()
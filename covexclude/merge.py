@@ -0,0 +1,136 @@
+"""Merges the coverage data recorded by the shards of a test run, see
+--cov-exclude-shard, back into a single cache.
+
+"""
+
+import argparse
+import sys
+
+from . import (cachefile, digest, driver, environment, filehashcache,
+               linecache, plugin)
+
+
+def merge(serialized_shard_data):
+    """Merge the serialized cache data written by each shard into one.
+
+    Every shard starts out from the same cache, and records the tests it
+    ran on top of it. The record from the shard that actually ran a test
+    is used for it, or the shared earlier record if no shard ran it.
+
+    """
+    shards = []
+    fingerprint = None
+    hash_backend = None
+
+    for serialized_cache_data in serialized_shard_data:
+        cache_data = plugin.load_cache_data(serialized_cache_data)
+
+        if not cache_data:
+            continue
+
+        if not shards:
+            fingerprint = cache_data.get(plugin.CACHE_ENVIRONMENT_KEY)
+            hash_backend = cache_data.get(plugin.CACHE_HASH_BACKEND_KEY)
+        elif (cache_data.get(plugin.CACHE_ENVIRONMENT_KEY) != fingerprint or
+              cache_data.get(plugin.CACHE_HASH_BACKEND_KEY) != hash_backend):
+            raise ValueError(
+                'Shards were recorded in different environments, or with '
+                'different hash backends')
+
+        shards.append(plugin.load_driver(serialized_cache_data))
+
+    hash_function = digest.backend(hash_backend or digest.AUTO)
+    merged = driver.Driver(
+        linecache.LineCache(None, hash_function),
+        filehashcache.FileHashCache(None, hash_function),
+        environment.DistributionCache(None),
+        None)
+
+    for shard in shards:
+        merged.failed_tests.update(shard.previously_failed_tests)
+        merged.file_hash_cache.file_hashes.update(
+            shard.file_hash_cache.previous_file_hashes)
+        merged.distribution_cache.versions.update(
+            shard.distribution_cache.previous_versions)
+
+    for shard in shards:
+        for item_id in shard.previous_session_tests:
+            merged.recorded_profiles[item_id] = _copy_profile(
+                shard, merged, item_id)
+
+            if item_id in shard.previous_durations:
+                merged.durations[item_id] = \
+                    shard.previous_durations[item_id]
+
+    for shard in shards:
+        for item_id in shard.previously_recorded_profiles:
+            if item_id in merged.recorded_profiles:
+                continue
+
+            if item_id in merged.previously_recorded_profiles:
+                continue
+
+            merged.previously_recorded_profiles[item_id] = \
+                len(merged.previous_profiles)
+            merged.previous_profiles.append(
+                _copy_profile(shard, merged, item_id))
+
+        for item_id, duration in shard.previous_durations.items():
+            if item_id not in merged.durations:
+                merged.previous_durations.setdefault(item_id, duration)
+
+    return plugin.dump_driver(merged, fingerprint, hash_backend)
+
+
+def _copy_profile(shard, merged, item_id):
+    """Copy the profile of a test from a shard's driver to the merged one,
+    translating its line cache keys.
+
+    """
+    keys, distributions = shard.previous_profiles[
+        shard.previously_recorded_profiles[item_id]]
+
+    merged_keys = []
+    for key in keys:
+        filename_index, start, end, content = shard.line_cache.lookup(key)
+        filename = shard.line_cache.filenames[filename_index]
+
+        merged_keys.append(merged.line_cache.merge_hashed_record(
+            merged.line_cache.filename_index(filename),
+            start, end, content))
+
+    return tuple(sorted(merged_keys)), distributions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='cov-exclude-merge',
+        description='Merge the pytest caches written by the shards of a '
+                    'test run using --cov-exclude-shard. Run this from the '
+                    'same directory as py.test.')
+    parser.add_argument(
+        '--cache-dir',
+        help='pytest cache directory to write the merged data to, by '
+             'default the one set by the cache_dir ini option, or else '
+             '.pytest_cache or .cache')
+    parser.add_argument(
+        'shard_cache_dirs', nargs='+', metavar='SHARD_CACHE_DIR',
+        help='pytest cache directories written by each shard')
+
+    args = parser.parse_args(argv)
+
+    if args.cache_dir is None:
+        args.cache_dir = cachefile.default_cache_dir()
+
+    merged = merge([
+        cachefile.read(cache_dir, plugin.CACHE_KEY, '{}')
+        for cache_dir in args.shard_cache_dirs
+    ])
+
+    cachefile.write(args.cache_dir, plugin.CACHE_KEY, merged)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
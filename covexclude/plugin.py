@@ -1,20 +1,31 @@
-import coverage
+import pytest
 
 try:
     import ujson
 except ImportError:
     import json as ujson
 
-from . import linecache, filehashcache, driver
+from . import (linecache, filehashcache, filerecorder, environment,
+               digest, driver, sharding)
 
 CACHE_KEY = 'cache/coverage-by-test'
 CACHE_VERSION_KEY = 'version'
-CACHE_VERSION = 5
+CACHE_VERSION = 7
 CACHE_FAILED_TESTS = 'failed_tests'
+CACHE_ENVIRONMENT_KEY = 'environment'
+CACHE_HASH_BACKEND_KEY = 'hash_backend'
 CACHE_FILE_HASH_CACHE_KEY = 'file_hashes'
+CACHE_DISTRIBUTIONS_KEY = 'distributions'
 CACHE_LINE_CACHE_KEY = 'line_cache'
 CACHE_DRIVER_KEY = 'driver'
 
+MODE_FULL = 'full'
+MODE_DESELECT = 'deselect'
+MODE_RECORD = 'record'
+
+# (driver, fingerprint, hash backend) handed over by preload_driver
+_preloaded_driver = None
+
 
 class CoverageExclusionPlugin:
     def __init__(self, config):
@@ -22,75 +33,148 @@ class CoverageExclusionPlugin:
 
         self.config = config
         self.current_cov = None
+        self.collect_cov = None
+        self.file_recorder = filerecorder.FileRecorder(str(config.rootdir))
+        self.fingerprint = environment.fingerprint(
+            config.getini('cov_exclude_env'))
+
+        try:
+            self.hash_backend = digest.resolve(
+                config.getini('cov_exclude_hash'))
+        except ValueError as e:
+            raise pytest.UsageError('cov_exclude_hash: {}'.format(e))
+
+        mode = config.getoption('cov_exclude_mode')
+
+        # Nothing recorded during --collect-only would ever be used,
+        # since no tests run
+        self.record = (mode != MODE_DESELECT and
+                       not config.getoption('collectonly'))
+        self.deselect = mode != MODE_RECORD
+        self.shard = config.getoption('cov_exclude_shard')
+
+        # Loaded on first use by _load_cache, so that runs which never
+        # reach collection don't pay for parsing the cache
+        self.file_hash_cache = None
+        self.line_cache = None
+        self.distribution_cache = None
+        self.driver = None
+
+    def _load_cache(self):
+        if self.driver is not None:
+            return
 
-        cache_data = ujson.loads(config.cache.get(CACHE_KEY, '{}'))
-        if cache_data.get(CACHE_VERSION_KEY) != CACHE_VERSION:
-            cache_data = {}
-
-        self.file_hash_cache = filehashcache.FileHashCache(
-            cache_data.get(CACHE_FILE_HASH_CACHE_KEY))
+        if (_preloaded_driver is not None and
+                _preloaded_driver[1:] == (self.fingerprint,
+                                          self.hash_backend)):
+            self.driver = _preloaded_driver[0]
+        else:
+            self.driver = load_driver(
+                self.config.cache.get(CACHE_KEY, '{}'),
+                self.fingerprint,
+                self.hash_backend)
 
-        self.line_cache = linecache.LineCache(
-            cache_data.get(CACHE_LINE_CACHE_KEY))
+        self.file_hash_cache = self.driver.file_hash_cache
+        self.line_cache = self.driver.line_cache
+        self.distribution_cache = self.driver.distribution_cache
 
-        self.driver = driver.Driver(
-            self.line_cache,
-            self.file_hash_cache,
-            cache_data.get(CACHE_DRIVER_KEY))
+        # The prefetched data is only used for deselection
+        if self.deselect:
+            self.driver.prefetch(self.line_cache.filenames)
 
     def pytest_runtest_setup(self, item):
+        if not self.record:
+            return
+
         assert not self.current_cov
 
-        self.current_cov = coverage.Coverage()
-        self.current_cov.start()
+        self.current_cov = _start_coverage()
+        self.file_recorder.start()
 
     def pytest_runtest_teardown(self, item, nextitem):
         if not self.current_cov:
             return
 
         self.current_cov.stop()
+        opened_files = self.file_recorder.stop()
 
         data = self.current_cov.get_data()
         self.current_cov = None
 
         data.update(item._extra_cov_data)
 
-        self.driver.report_test_coverage(item.nodeid, data)
+        self.driver.report_test_coverage(item.nodeid, data, opened_files)
 
     def pytest_runtest_logreport(self, report):
+        if not self.record:
+            return
+
+        self.driver.report_test_duration(report.nodeid, report.duration)
+
         if report.failed and 'xfail' not in report.keywords:
             self.driver.report_test_failure(report.nodeid)
 
     def pytest_sessionfinish(self, session):
+        if not self.record or self.driver is None:
+            return
+
+        self.driver.wait_for_prefetch()
         self.file_hash_cache.hash_missing_files(self.line_cache.filenames)
 
-        self.config.cache.set(CACHE_KEY, ujson.dumps({
-            CACHE_VERSION_KEY: CACHE_VERSION,
-            CACHE_FILE_HASH_CACHE_KEY: self.file_hash_cache.to_json(),
-            CACHE_LINE_CACHE_KEY: self.line_cache.to_json(),
-            CACHE_DRIVER_KEY: self.driver.to_json(),
-        }))
+        self.config.cache.set(CACHE_KEY, dump_driver(
+            self.driver, self.fingerprint, self.hash_backend))
 
     def pytest_collection_modifyitems(self, session, config, items):
-        to_keep = []
-        to_skip = []
+        if not self.deselect and self.shard is None:
+            return
+
+        self._load_cache()
 
-        known_identical_items = set()
+        to_keep = items
+        to_skip = []
 
-        for item in items:
-            if self._should_execute_item(item, known_identical_items):
-                to_keep.append(item)
-            else:
-                to_skip.append(item)
+        if self.deselect:
+            known_identical_items = set()
+            to_keep = []
+
+            for item in items:
+                if self._should_execute_item(item, known_identical_items):
+                    to_keep.append(item)
+                else:
+                    to_skip.append(item)
+
+        if self.shard is not None:
+            index, count = self.shard
+            buckets = sharding.split(
+                [item.nodeid for item in to_keep],
+                self.driver.merged_durations(),
+                count)
+            shard_item_ids = frozenset(buckets[index - 1])
+
+            to_skip += [item for item in to_keep
+                        if item.nodeid not in shard_item_ids]
+            to_keep = [item for item in to_keep
+                       if item.nodeid in shard_item_ids]
+
+        # Make sure the prefetch is done before any test runs, even if
+        # no item was checked above
+        self.driver.wait_for_prefetch()
 
         items[:] = to_keep
         config.hook.pytest_deselected(items=to_skip)
 
     def pytest_collectstart(self, collector):
-        self.collect_cov = coverage.Coverage()
-        self.collect_cov.start()
+        # Load the cache as early as possible, so the prefetch overlaps
+        # with the rest of the collection phase
+        self._load_cache()
+
+        if self.record:
+            self.collect_cov = _start_coverage()
 
     def pytest_itemcollected(self, item):
+        if not self.collect_cov:
+            return
+
         self.collect_cov.stop()
         item._extra_cov_data = self.collect_cov.get_data()
 
@@ -104,12 +188,136 @@ class CoverageExclusionPlugin:
             item.nodeid, known_identical_items)
 
 
+def load_cache_data(serialized_cache_data):
+    cache_data = ujson.loads(serialized_cache_data)
+    if cache_data.get(CACHE_VERSION_KEY) != CACHE_VERSION:
+        cache_data = {}
+
+    return cache_data
+
+
+def load_driver(serialized_cache_data, fingerprint=None, hash_backend=None):
+    """Build a driver, along with the caches it uses, from the data stored
+    in pytest's cache.
+
+    All data is discarded if it was recorded in a different environment
+    than the given fingerprint, or hashed with a different backend. Pass
+    None as fingerprint to skip that check, and None as hash backend to
+    use the one the data was recorded with.
+
+    """
+    return driver_from_cache_data(load_cache_data(serialized_cache_data),
+                                  fingerprint, hash_backend)
+
+
+def driver_from_cache_data(cache_data, fingerprint=None, hash_backend=None):
+    """Like load_driver, but for cache data that is already parsed"""
+    if (fingerprint is not None and
+            cache_data.get(CACHE_ENVIRONMENT_KEY) != fingerprint):
+        cache_data = {}
+
+    if hash_backend is None:
+        hash_backend = cache_data.get(CACHE_HASH_BACKEND_KEY, digest.AUTO)
+
+    if cache_data.get(CACHE_HASH_BACKEND_KEY) != hash_backend:
+        cache_data = {}
+
+    hash_function = digest.backend(hash_backend)
+
+    return driver.Driver(
+        linecache.LineCache(
+            cache_data.get(CACHE_LINE_CACHE_KEY), hash_function),
+        filehashcache.FileHashCache(
+            cache_data.get(CACHE_FILE_HASH_CACHE_KEY), hash_function),
+        environment.DistributionCache(
+            cache_data.get(CACHE_DISTRIBUTIONS_KEY)),
+        cache_data.get(CACHE_DRIVER_KEY))
+
+
+def preload_driver(current_driver, fingerprint, hash_backend):
+    """Make the sessions of this process use an already loaded driver
+    instead of loading the cache, as long as its data was recorded in the
+    same environment and with the same hash backend.
+
+    Used by watch mode, which forks each test run from a process that
+    keeps the driver loaded between runs.
+
+    """
+    global _preloaded_driver
+    _preloaded_driver = (current_driver, fingerprint, hash_backend)
+
+
+def dump_driver(current_driver, fingerprint, hash_backend):
+    """Serialize a driver, along with the caches it uses, for storing in
+    pytest's cache.
+
+    """
+    return ujson.dumps({
+        CACHE_VERSION_KEY: CACHE_VERSION,
+        CACHE_ENVIRONMENT_KEY: fingerprint,
+        CACHE_HASH_BACKEND_KEY: hash_backend,
+        CACHE_FILE_HASH_CACHE_KEY: current_driver.file_hash_cache.to_json(),
+        CACHE_DISTRIBUTIONS_KEY: current_driver.distribution_cache.to_json(
+            current_driver.distribution_names()),
+        CACHE_LINE_CACHE_KEY: current_driver.line_cache.to_json(),
+        CACHE_DRIVER_KEY: current_driver.to_json(),
+    })
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('cov-exclude')
+    group.addoption(
+        '--cov-exclude-mode',
+        action='store',
+        dest='cov_exclude_mode',
+        default=MODE_FULL,
+        choices=[MODE_FULL, MODE_DESELECT, MODE_RECORD],
+        help='"full" (default) deselects unaffected tests and records '
+             'coverage for the rest, "deselect" only deselects tests and '
+             'leaves the cache untouched, "record" runs every test and '
+             'records its coverage')
+    group.addoption(
+        '--cov-exclude-shard',
+        action='store',
+        dest='cov_exclude_shard',
+        default=None,
+        type=sharding.parse_shard,
+        metavar='i/N',
+        help='Split the tests that remain after deselection into N shards '
+             'of similar recorded duration, and only run shard i (1 to N)')
+
+    parser.addini(
+        'cov_exclude_env',
+        type='args',
+        default=[],
+        help='Environment variables that invalidate all recorded coverage '
+             'data when their values change')
+
+    parser.addini(
+        'cov_exclude_hash',
+        default=digest.AUTO,
+        help='Hash backend used to detect changes: "auto" (default) picks '
+             'the fastest available of ' +
+             ', '.join(digest.available_backends()))
+
+
 def pytest_configure(config):
     config.pluginmanager.register(
         CoverageExclusionPlugin(config),
         "coverage-exclusion")
 
 
+def _start_coverage():
+    # coverage is imported lazily since it is slow to import, and not
+    # needed at all in runs that don't record anything
+    import coverage
+
+    cov = coverage.Coverage()
+    cov.start()
+
+    return cov
+
+
 def _debug_coverage_data(data):
     for filename in data.measured_files():
         if 'site-packages' in filename:
@@ -0,0 +1,56 @@
+import argparse
+import heapq
+
+# Assumed duration of tests when there is no recorded duration for any
+# test at all
+DEFAULT_DURATION = 1.0
+
+
+def parse_shard(value):
+    """Parse a shard specification of the form "i/N", where i goes from 1
+    to N.
+
+    """
+    try:
+        index, count = [int(part) for part in value.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'Expected a shard of the form i/N, got {!r}'.format(value))
+
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(
+            'Shard index must be between 1 and {}, got {}'.format(
+                count, index))
+
+    return index, count
+
+
+def split(item_ids, durations, count):
+    """Split the given tests into count buckets with roughly equal total
+    duration, by assigning the longest remaining test to the bucket with
+    the lowest total so far.
+
+    Tests without a recorded duration are assumed to take as long as the
+    average test. The result only depends on the arguments, so every
+    shard computes the same buckets.
+
+    """
+    known_durations = [durations[i] for i in item_ids if i in durations]
+
+    if known_durations:
+        default_duration = sum(known_durations) / len(known_durations)
+    else:
+        default_duration = DEFAULT_DURATION
+
+    def duration(item_id):
+        return durations.get(item_id, default_duration)
+
+    buckets = [[] for _ in range(count)]
+    totals = [(0.0, i) for i in range(count)]
+
+    for item_id in sorted(set(item_ids), key=lambda i: (-duration(i), i)):
+        total, i = heapq.heappop(totals)
+        buckets[i].append(item_id)
+        heapq.heappush(totals, (total + duration(item_id), i))
+
+    return buckets
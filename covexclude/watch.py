@@ -0,0 +1,240 @@
+"""Watch mode: keeps the recorded coverage data loaded between test runs,
+and re-runs the tests affected by each change to a recorded file.
+
+Where os.fork is available, each test run is forked from the watching
+process, so it starts out with pytest imported and the coverage data and
+file hashes already loaded.
+
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from . import cachefile, plugin
+
+
+class Watcher:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.cache_stat = None
+
+        self.driver = None
+        self.fingerprint = None
+        self.hash_backend = None
+
+        # filename => (mtime, size)
+        self.file_stats = {}
+
+        # filename => hash of its contents when file_stats was taken
+        self.file_hashes = {}
+
+        # Files found to have changed since the coverage data was recorded,
+        # before they were watched
+        self.pending_changes = set()
+
+        # filename_index => [range key]
+        self.keys_by_file = {}
+
+        # range key => {item_id}
+        self.items_by_key = {}
+
+    def reload_if_changed(self):
+        """Reload the coverage data if a test run has written a new version
+        of it since the last time it was loaded.
+
+        """
+        cache_path = cachefile.value_path(self.cache_dir, plugin.CACHE_KEY)
+        cache_stat = _stat(cache_path)
+
+        if self.driver is not None and cache_stat == self.cache_stat:
+            return
+
+        self.cache_stat = cache_stat
+
+        cache_data = plugin.load_cache_data(
+            cachefile.read(self.cache_dir, plugin.CACHE_KEY, '{}'))
+        self.fingerprint = cache_data.get(plugin.CACHE_ENVIRONMENT_KEY)
+        self.hash_backend = cache_data.get(plugin.CACHE_HASH_BACKEND_KEY)
+        self.driver = plugin.driver_from_cache_data(cache_data)
+
+        self.keys_by_file = {}
+        self.items_by_key = {}
+
+        for item_id, (keys, _) in self.driver.merged_profiles().items():
+            for key in keys:
+                self.items_by_key.setdefault(key, set()).add(item_id)
+
+        for key in self.items_by_key:
+            filename_index = self.driver.line_cache.lookup(key)[0]
+            self.keys_by_file.setdefault(filename_index, []).append(key)
+
+        file_hash_cache = self.driver.file_hash_cache
+
+        # Keep the stats and hashes of files that were already watched, so
+        # changes made while the tests were running are still picked up,
+        # and unchanged files aren't hashed again
+        for filename in self.driver.line_cache.filenames:
+            if filename not in self.file_stats:
+                self._update_file(filename)
+
+                if (self.file_hashes[filename] !=
+                        file_hash_cache.previous_file_hashes.get(filename)):
+                    self.pending_changes.add(filename)
+
+        file_hash_cache.file_hashes.update(self.file_hashes)
+
+    def changed_files(self):
+        changed = self.pending_changes
+        self.pending_changes = set()
+
+        for filename, old_stat in list(self.file_stats.items()):
+            if _stat(filename) != old_stat:
+                self._update_file(filename)
+                changed.add(filename)
+
+        return sorted(changed)
+
+    def _update_file(self, filename):
+        # Stat before hashing, so a change made in between shows up as a
+        # changed stat in the next check
+        self.file_stats[filename] = _stat(filename)
+
+        self.driver.forget_files([filename])
+        self.driver.file_hash_cache.hash_missing_files([filename])
+        self.file_hashes[filename] = \
+            self.driver.file_hash_cache.file_hashes[filename]
+
+    def affected_items(self, filenames):
+        """Determine which tests need to be re-run after the given files
+        have changed, by only re-checking the ranges within those files.
+
+        Previously failed tests are always included.
+
+        """
+        items = set(self.driver.previously_failed_tests)
+
+        for filename in filenames:
+            filename_index = self.driver.line_cache.filename_indices.get(
+                filename)
+
+            for key in self.keys_by_file.get(filename_index, []):
+                if self.driver.is_range_changed(key):
+                    items.update(self.items_by_key[key])
+
+        return items
+
+    def run_tests(self, test_files, pytest_args):
+        """Run py.test on the given test files, handing the loaded driver
+        over to the run where possible. Returns the exit status.
+
+        """
+        args = list(pytest_args) + list(test_files)
+
+        if not hasattr(os, 'fork'):
+            return subprocess.call(['py.test'] + args)
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        pid = os.fork()
+
+        if pid == 0:
+            status = 1
+            try:
+                plugin.preload_driver(
+                    self.driver, self.fingerprint, self.hash_backend)
+                status = int(pytest.main(args))
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+
+        _, status = os.waitpid(pid, 0)
+
+        if os.WIFEXITED(status):
+            return os.WEXITSTATUS(status)
+
+        return 1
+
+
+def _test_files_of(item_ids):
+    """Map test ids to the test files containing them, leaving out files
+    that no longer exist.
+
+    Running whole files rather than individual ids avoids pytest errors
+    for ids that have been renamed or removed, while the plugin itself
+    still deselects the unaffected tests inside them.
+
+    """
+    return sorted(set(
+        f for f in (item_id.split('::')[0] for item_id in item_ids)
+        if os.path.isfile(f)
+    ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='cov-exclude-watch',
+        description='Watch the files covered by the recorded test suite, '
+                    'and re-run the affected tests when they change. Run '
+                    'this from the same directory as py.test.')
+    parser.add_argument(
+        '--interval', type=float, default=0.5,
+        help='Seconds between checks for changed files')
+    parser.add_argument(
+        '--cache-dir',
+        help='pytest cache directory, by default the one set by the '
+             'cache_dir ini option, or else .pytest_cache or .cache')
+    parser.add_argument(
+        'pytest_args', nargs=argparse.REMAINDER,
+        help='Extra arguments passed to py.test')
+
+    args = parser.parse_args(argv)
+
+    if args.cache_dir is None:
+        args.cache_dir = cachefile.default_cache_dir()
+
+    # Imported up front so that forked test runs start out with it, like
+    # pytest itself
+    import coverage  # noqa
+
+    watcher = Watcher(args.cache_dir)
+    watcher.reload_if_changed()
+
+    if not watcher.file_stats:
+        print('No coverage data found in {}; run py.test once before '
+              'starting watch mode'.format(args.cache_dir))
+        return 1
+
+    try:
+        while True:
+            changed = watcher.changed_files()
+
+            if changed:
+                test_files = _test_files_of(watcher.affected_items(changed))
+
+                if test_files:
+                    watcher.run_tests(test_files, args.pytest_args)
+                    watcher.reload_if_changed()
+
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+
+def _stat(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+
+    return (st.st_mtime, st.st_size)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -51,6 +51,10 @@ setup(
         'pytest11': [
             'cov-exclude = covexclude.plugin',
         ],
+        'console_scripts': [
+            'cov-exclude-watch = covexclude.watch:main',
+            'cov-exclude-merge = covexclude.merge:main',
+        ],
     },
 
     install_requires=install_requires,
@@ -63,6 +67,9 @@ setup(
             'twine',
             'wheel',
         ],
+        'xxhash': [
+            'xxhash>=2.0.0',
+        ],
     },
 
     classifiers=[
@@ -0,0 +1,65 @@
+import pytest
+
+from covexclude import digest, environment, plugin
+
+
+class FakeCoverageData:
+    """Stands in for coverage data, mapping each measured file to a list
+    of covered line numbers"""
+
+    def __init__(self, file_lines):
+        self.file_lines = file_lines
+
+    def measured_files(self):
+        return list(self.file_lines)
+
+    def lines(self, filename):
+        return self.file_lines[filename]
+
+
+@pytest.fixture
+def run_session():
+    """Run a session through the driver like the plugin would, but without
+    running pytest or coverage.
+
+    The returned function takes the serialized cache data from the
+    previous session, a mapping from test id to the FakeCoverageData
+    format, and optionally a mapping from test id to the files the test
+    read. It returns the new serialized cache data, and the sorted ids
+    of the tests that were not deselected.
+
+    """
+
+    def run(serialized_cache_data, tests, opened_files=None):
+        fingerprint = environment.fingerprint([])
+        hash_backend = digest.resolve(digest.AUTO)
+
+        test_driver = plugin.load_driver(
+            serialized_cache_data, fingerprint, hash_backend)
+
+        known_identical_items = set()
+        executed = []
+
+        for item_id in sorted(tests):
+            if not test_driver.should_execute_item(
+                    item_id, known_identical_items):
+                continue
+
+            executed.append(item_id)
+
+            coverage_data = FakeCoverageData(tests[item_id])
+            test_driver.cache_files_from_coverage(coverage_data)
+            test_driver.report_test_coverage(
+                item_id,
+                coverage_data,
+                (opened_files or {}).get(item_id, []))
+
+        test_driver.file_hash_cache.hash_missing_files(
+            test_driver.line_cache.filenames)
+
+        serialized_cache_data = plugin.dump_driver(
+            test_driver, fingerprint, hash_backend)
+
+        return serialized_cache_data, executed
+
+    return run
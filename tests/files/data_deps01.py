@@ -0,0 +1,6 @@
+import os.path
+
+
+def test_data_deps01():
+    with open(os.path.join(os.path.dirname(__file__), 'data.txt')) as f:
+        assert f.read() == 'expected\n'
@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.mark.parametrize('x,y', [
+    (1, 2),
+    (2, 4),
+    (3, 6),
+])
+def test_doubling(x, y):
+    assert y == 2 * x
@@ -0,0 +1,14 @@
+def test_shard01_a():
+    assert True
+
+
+def test_shard01_b():
+    assert True
+
+
+def test_shard01_c():
+    assert True
+
+
+def test_shard01_d():
+    assert True
@@ -0,0 +1,33 @@
+import pytest
+
+from covexclude import cachefile
+
+
+@pytest.mark.parametrize('files, dirs, expected', [
+    ({}, [], '.pytest_cache'),
+    ({}, ['.cache'], '.cache'),
+    ({}, ['.cache', '.pytest_cache'], '.pytest_cache'),
+    ({'pytest.ini': '[pytest]\ncache_dir = custom\n'}, [], 'custom'),
+    ({'tox.ini': '[pytest]\ncache_dir = custom\n'}, [], 'custom'),
+    ({'setup.cfg': '[tool:pytest]\ncache_dir = custom\n'}, [], 'custom'),
+    ({'setup.cfg': '[pytest]\ncache_dir = custom\n'}, [], 'custom'),
+    ({'pytest.ini': '[pytest]\ncache_dir = $CACHE_ROOT/cache\n'}, [],
+     'expanded/cache'),
+
+    # pytest only reads options from the first file with a pytest section
+    ({'pytest.ini': '[pytest]\naddopts = -x\n',
+      'tox.ini': '[pytest]\ncache_dir = custom\n'}, ['.cache'], '.cache'),
+    ({'tox.ini': '[tox]\nenvlist = py27\n',
+      'setup.cfg': '[tool:pytest]\ncache_dir = custom\n'}, [], 'custom'),
+])
+def test_default_cache_dir(tmpdir, monkeypatch, files, dirs, expected):
+    monkeypatch.setenv('CACHE_ROOT', 'expanded')
+
+    for filename, content in files.items():
+        tmpdir.join(filename).write(content)
+
+    for dirname in dirs:
+        tmpdir.join(dirname).ensure(dir=True)
+
+    assert cachefile.default_cache_dir(str(tmpdir)) == \
+        str(tmpdir.join(expected))
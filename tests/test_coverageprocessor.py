@@ -0,0 +1,67 @@
+import pytest
+
+from conftest import FakeCoverageData
+
+from covexclude import digest, linecache
+from covexclude.coverageprocessor import (determine_non_measured_lines,
+                                          get_lines_in_file)
+
+
+@pytest.mark.parametrize('content, line_numbers, expected', [
+    # A covered line is extended over the blank lines following it
+    ('a\nb\n\n\nc\n', [1], [(1, 4, 'b\n\n')]),
+    ('a\n   \nb\n', [0], [(0, 2, 'a\n   ')]),
+
+    # Runs reaching the end of the file end with an EOF marker
+    ('a\nb\n', [1], [(1, 2, 'b\n')]),
+    ('a\nb\n\n\n', [1], [(1, 4, 'b\n\n\n')]),
+
+    # Covered lines separated only by blank lines form a single run
+    ('a\n\nb\nc\n', [0, 2], [(0, 3, 'a\n\nb')]),
+    ('a\nb\nc\nd\n', [0, 2], [(0, 1, 'a'), (2, 3, 'c')]),
+    ('a\nb\nc\nd\n', [2, 0, 2], [(0, 1, 'a'), (2, 3, 'c')]),
+
+    # Line numbers outside of the file are ignored
+    ('a\n', [-1, 0, 1, 5], [(0, 1, 'a\n')]),
+    ('a\n', [5], []),
+])
+def test_get_lines_in_file(tmpdir, content, line_numbers, expected):
+    source = tmpdir.join('source.py')
+    source.write(content)
+
+    assert get_lines_in_file(str(source), line_numbers, {}) == expected
+
+
+def test_get_lines_in_missing_file(tmpdir):
+    assert get_lines_in_file(str(tmpdir.join('missing.py')), [0], {}) == []
+
+
+@pytest.mark.parametrize('records, covered_lines, expected_records, '
+                         'expected_lines', [
+    ([], [1, 2, 5], [], [0, 1, 4]),
+
+    # Covered lines within a matching record are not looked up again
+    ([(0, 3)], [1, 2, 3, 5], [(0, 3)], [4]),
+    ([(0, 3)], [1, 4], [(0, 3)], [3]),
+    ([(2, 4)], [1, 3, 4], [(2, 4)], [0]),
+    ([(0, 1), (2, 3)], [1, 3], [(0, 1), (2, 3)], []),
+
+    # Records only match covered lines they start at
+    ([(1, 3)], [1, 3], [], [0, 2]),
+])
+def test_determine_non_measured_lines(tmpdir, records, covered_lines,
+                                      expected_records, expected_lines):
+    filename = str(tmpdir.join('source.py'))
+
+    line_cache = linecache.LineCache(None, digest.backend('md5'))
+    filename_index = line_cache.filename_index(filename)
+
+    for start, end in records:
+        line_cache.save_record(filename_index, start, end, 'content')
+
+    indices, non_measured_lines = determine_non_measured_lines(
+        FakeCoverageData({filename: covered_lines}), [filename], line_cache)
+
+    assert [line_cache.lookup(i)[1:3] for i in indices] == \
+        [tuple(r) for r in expected_records]
+    assert non_measured_lines == {filename: expected_lines}
@@ -1,9 +1,13 @@
+import json
 import subprocess
 import os.path
+import sys
 import time
 
 import pytest
 
+from covexclude import cachefile, digest, plugin
+
 
 def from_here(*args):
     return os.path.join(os.path.dirname(__file__), *args)
@@ -21,18 +25,19 @@ def write_test_files(filename, tmpdir):
         tmpdir.join('test.pyc').remove()
 
 
-def start_test_process(filename, tmpdir):
+def start_test_process(filename, tmpdir, args=(), env=None):
     write_test_files(filename, tmpdir)
 
-    p = subprocess.Popen(['py.test', '-v', 'test.py'],
+    p = subprocess.Popen(['py.test', '-v'] + list(args) + ['test.py'],
                          cwd=str(tmpdir),
+                         env=env,
                          stdout=subprocess.PIPE)
 
     return p
 
 
-def run_test_file(filename, tmpdir):
-    p = start_test_process(filename, tmpdir)
+def run_test_file(filename, tmpdir, args=(), env=None):
+    p = start_test_process(filename, tmpdir, args, env)
 
     stdout, _ = p.communicate()
 
@@ -117,6 +122,180 @@ def test_deselect_nochange(filename, n_tests, tmpdir):
     assert expect_deselect in stdout_deselect
 
 
+@pytest.mark.external_dependencies
+def test_parametrize_shares_profile(tmpdir):
+    """The cases of a parametrized test should share one recorded profile,
+    and all be re-run when it changes"""
+
+    assert not tmpdir.join('.cache').check()
+
+    stdout = run_test_file('parametrize01.py', tmpdir)
+    assert b'3 passed' in stdout
+
+    cache_data = json.loads(cachefile.read(
+        str(tmpdir.join('.cache')), plugin.CACHE_KEY, '{}'))
+    driver_data = cache_data['driver']
+
+    assert len(driver_data['recorded_profiles']) == 3
+    assert len(driver_data['profiles']) == 1
+
+    stdout = run_test_file('parametrize05.py', tmpdir)
+    assert b'3 passed' in stdout
+
+
+@pytest.mark.external_dependencies
+def test_data_file_dependencies(tmpdir):
+    """Changing a data file read by a test should re-run the test"""
+
+    assert not tmpdir.join('.cache').check()
+
+    tmpdir.join('data.txt').write('expected\n')
+
+    stdout = run_test_file('data_deps01.py', tmpdir)
+    assert b'1 passed' in stdout
+
+    stdout = run_test_file('data_deps01.py', tmpdir)
+    assert b'1 deselected' in stdout
+
+    tmpdir.join('data.txt').write('changed\n')
+
+    stdout = run_test_file('data_deps01.py', tmpdir)
+    assert b'1 failed' in stdout
+
+
+@pytest.mark.external_dependencies
+def test_environment_variables(tmpdir):
+    """Changing an environment variable listed in cov_exclude_env should
+    re-run all tests"""
+
+    assert not tmpdir.join('.cache').check()
+
+    tmpdir.join('pytest.ini').write(
+        '[pytest]\ncov_exclude_env = COV_EXCLUDE_TEST_VAR\n')
+
+    env = dict(os.environ, COV_EXCLUDE_TEST_VAR='1')
+
+    stdout = run_test_file('simple01.py', tmpdir, env=env)
+    assert b'1 passed' in stdout
+
+    stdout = run_test_file('simple01.py', tmpdir, env=env)
+    assert b'1 deselected' in stdout
+
+    env['COV_EXCLUDE_TEST_VAR'] = '2'
+
+    stdout = run_test_file('simple01.py', tmpdir, env=env)
+    assert b'1 passed' in stdout
+
+
+@pytest.mark.external_dependencies
+def test_shards(tmpdir):
+    """Each shard should only run its own part of the affected tests, and
+    the other tests should still run afterwards"""
+
+    assert not tmpdir.join('.cache').check()
+
+    stdout = run_test_file('shard01.py', tmpdir, ['--cov-exclude-shard=1/2'])
+    assert b'2 passed' in stdout
+    assert b'2 deselected' in stdout
+
+    stdout = run_test_file('shard01.py', tmpdir)
+    assert b'2 passed' in stdout
+    assert b'2 deselected' in stdout
+
+
+@pytest.mark.external_dependencies
+def test_merge_shards(tmpdir):
+    """Merging the caches written by all shards should deselect every test
+    any of the shards ran"""
+
+    assert not tmpdir.join('.cache').check()
+
+    for shard in ['1/2', '2/2']:
+        stdout = run_test_file('shard01.py', tmpdir,
+                               ['--cov-exclude-shard=' + shard])
+        assert b'2 passed' in stdout
+
+        tmpdir.join('.cache').move(tmpdir.join('shard' + shard[0]))
+
+    subprocess.check_call(
+        [sys.executable, '-m', 'covexclude.merge', '--cache-dir', '.cache',
+         'shard1', 'shard2'],
+        cwd=str(tmpdir))
+
+    stdout = run_test_file('shard01.py', tmpdir)
+    assert b'4 deselected' in stdout
+
+
+@pytest.mark.external_dependencies
+def test_hash_backend_change(tmpdir):
+    """Switching hash backends should discard the recorded data, rather
+    than compare hashes made by different backends"""
+
+    other_backends = [b for b in digest.available_backends() if b != 'md5']
+    if not other_backends:
+        pytest.skip('Only one hash backend is available')
+
+    assert not tmpdir.join('.cache').check()
+
+    ini = tmpdir.join('pytest.ini')
+    ini.write('[pytest]\ncov_exclude_hash = md5\n')
+
+    stdout = run_test_file('simple01.py', tmpdir)
+    assert b'1 passed' in stdout
+
+    stdout = run_test_file('simple01.py', tmpdir)
+    assert b'1 deselected' in stdout
+
+    ini.write('[pytest]\ncov_exclude_hash = {}\n'.format(other_backends[0]))
+
+    stdout = run_test_file('simple01.py', tmpdir)
+    assert b'1 passed' in stdout
+
+
+@pytest.mark.external_dependencies
+def test_unknown_hash_backend(tmpdir):
+    """An unknown hash backend should be reported as a usage error"""
+
+    tmpdir.join('pytest.ini').write('[pytest]\ncov_exclude_hash = unknown\n')
+    write_test_files('simple01.py', tmpdir)
+
+    p = subprocess.Popen(['py.test', 'test.py'],
+                         cwd=str(tmpdir),
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.STDOUT)
+    output, _ = p.communicate()
+
+    assert p.returncode != 0
+    assert b'cov_exclude_hash' in output
+    assert b'INTERNALERROR' not in output
+
+
+@pytest.mark.external_dependencies
+def test_deselect_and_record_modes(tmpdir):
+    """Deselect-only runs should never write to the cache, and
+    record-only runs should never deselect any tests"""
+
+    assert not tmpdir.join('.cache').check()
+
+    deselect_only = ['--cov-exclude-mode=deselect']
+    record_only = ['--cov-exclude-mode=record']
+
+    stdout = run_test_file('simple01.py', tmpdir, deselect_only)
+    assert b'1 passed' in stdout
+
+    stdout = run_test_file('simple01.py', tmpdir, deselect_only)
+    assert b'1 passed' in stdout
+
+    stdout = run_test_file('simple01.py', tmpdir, record_only)
+    assert b'1 passed' in stdout
+
+    stdout = run_test_file('simple01.py', tmpdir, record_only)
+    assert b'1 passed' in stdout
+
+    stdout = run_test_file('simple01.py', tmpdir, deselect_only)
+    assert b'1 deselected' in stdout
+
+
 @pytest.mark.external_dependencies
 @pytest.mark.parametrize('first_filename,second_filename', [
     ('alter_test01.py', 'alter_test02.py'),
@@ -0,0 +1,46 @@
+import pytest
+
+from covexclude import digest, environment, plugin
+
+
+def test_auto_picks_first_available_backend():
+    assert digest.resolve(digest.AUTO) == digest.available_backends()[0]
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        digest.resolve('unknown')
+
+
+@pytest.mark.parametrize('name', digest.available_backends())
+def test_backends(name):
+    hash_function = digest.backend(name)
+
+    assert hash_function(b'content') == hash_function(b'content')
+    assert hash_function(b'content') != hash_function(b'changed')
+
+    # Digests should be valid hex strings
+    int(hash_function(b'content'), 16)
+
+
+def test_backend_change_discards_cache(run_session, tmpdir, monkeypatch):
+    current_backend = digest.resolve(digest.AUTO)
+    other_backends = [b for b in digest.available_backends()
+                      if b != current_backend]
+    if not other_backends:
+        pytest.skip('Only one hash backend is available')
+
+    monkeypatch.chdir(tmpdir)
+
+    source = tmpdir.join('source.py')
+    source.write('x = 1\n')
+
+    data, _ = run_session('{}', {'test': {str(source): [1]}})
+    fingerprint = environment.fingerprint([])
+
+    same_driver = plugin.load_driver(data, fingerprint, current_backend)
+    assert not same_driver.should_execute_item('test', set())
+
+    other_driver = plugin.load_driver(data, fingerprint, other_backends[0])
+    assert other_driver.should_execute_item('test', set())
+    assert other_driver.line_cache.filenames == []
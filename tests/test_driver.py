@@ -0,0 +1,98 @@
+import json
+
+from covexclude import digest, environment, plugin
+
+
+def test_shared_profiles(run_session, tmpdir, monkeypatch):
+    """Tests with identical coverage should share a single profile, which
+    still selects all of them again when it changes"""
+
+    monkeypatch.chdir(tmpdir)
+
+    source = tmpdir.join('source.py')
+    source.write('def double(x):\n    return 2 * x\n\ny = 0\n')
+    other = tmpdir.join('other.py')
+    other.write('z = 0\n')
+
+    tests = {
+        'test[1]': {str(source): [1, 2]},
+        'test[2]': {str(source): [2, 1]},
+        'test[3]': {str(source): [1, 2]},
+        'other': {str(other): [1]},
+    }
+
+    data, executed = run_session('{}', tests)
+    assert len(executed) == 4
+
+    driver_data = json.loads(data)['driver']
+    assert len(driver_data['profiles']) == 2
+    assert len(set(
+        driver_data['recorded_profiles'][item_id]
+        for item_id in ['test[1]', 'test[2]', 'test[3]']
+    )) == 1
+
+    data, executed = run_session(data, tests)
+    assert executed == []
+
+    source.write('def double(x):\n    return x + x\n\ny = 0\n')
+
+    data, executed = run_session(data, tests)
+    assert executed == ['test[1]', 'test[2]', 'test[3]']
+
+
+def test_prefetch(run_session, tmpdir, monkeypatch):
+    """Prefetching should hash every recorded file and read the changed
+    ones, without affecting which tests are selected"""
+
+    monkeypatch.chdir(tmpdir)
+
+    changed = tmpdir.join('changed.py')
+    changed.write('x = 1\ny = 2\n')
+    unchanged = tmpdir.join('unchanged.py')
+    unchanged.write('z = 3\n')
+    deleted = tmpdir.join('deleted.py')
+    deleted.write('w = 4\n')
+    data_file = tmpdir.join('data.txt')
+    data_file.write('data')
+
+    tests = {
+        'uses_changed': {str(changed): [1]},
+        'uses_changed_elsewhere': {str(changed): [2]},
+        'uses_unchanged': {str(unchanged): [1]},
+        'uses_deleted': {str(deleted): [1]},
+        'uses_data': {str(unchanged): [1]},
+    }
+
+    data, _ = run_session(
+        '{}', tests, opened_files={'uses_data': [str(data_file)]})
+
+    changed.write('x = 10\ny = 2\n')
+    deleted.remove()
+
+    def load():
+        return plugin.load_driver(
+            data, environment.fingerprint([]), digest.resolve(digest.AUTO))
+
+    prefetched = load()
+    prefetched.prefetch(prefetched.line_cache.filenames)
+    prefetched.wait_for_prefetch()
+
+    assert str(changed) in prefetched.file_contents_cache
+    assert str(unchanged) not in prefetched.file_contents_cache
+    assert str(deleted) not in prefetched.file_contents_cache
+    assert sorted(prefetched.file_hash_cache.file_hashes) == \
+        sorted(prefetched.line_cache.filenames)
+
+    not_prefetched = load()
+
+    def selected(test_driver):
+        known_identical_items = set()
+
+        return [
+            item_id for item_id in sorted(tests)
+            if test_driver.should_execute_item(
+                item_id, known_identical_items)
+        ]
+
+    assert selected(prefetched) == selected(not_prefetched) == \
+        ['uses_changed', 'uses_deleted']
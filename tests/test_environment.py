@@ -0,0 +1,166 @@
+import json
+import os.path
+
+import pytest
+
+from covexclude import environment
+
+importlib_metadata = environment._import_metadata()
+
+pytestmark = pytest.mark.skipif(
+    importlib_metadata is None,
+    reason='Distribution tracking requires importlib.metadata')
+
+
+class SitePackages:
+    """A fake site-packages directory that distributions can be installed
+    into"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def install(self, name, version, files, top_level=None, record_extra=''):
+        for filename in files:
+            f = self.path.join(filename)
+            f.dirpath().ensure(dir=True)
+            f.write('')
+
+        dist_info = self.path.join('{}-{}.dist-info'.format(name, version))
+        dist_info.ensure(dir=True)
+
+        dist_info.join('METADATA').write(
+            'Metadata-Version: 2.1\nName: {}\nVersion: {}\n'.format(
+                name, version))
+
+        dist_info.join('RECORD').write(''.join(
+            '{},,\n'.format(filename)
+            for filename in files + [dist_info.basename + '/METADATA']
+        ) + record_extra)
+
+        if top_level is not None:
+            dist_info.join('top_level.txt').write('\n'.join(top_level))
+
+    def uninstall(self, name, version):
+        self.path.join('{}-{}.dist-info'.format(name, version)).remove()
+
+    def file(self, filename):
+        return str(self.path.join(filename))
+
+
+@pytest.fixture
+def site_packages(tmpdir, monkeypatch):
+    site = tmpdir.join('site-packages')
+    site.ensure(dir=True)
+
+    class Metadata:
+        @staticmethod
+        def distributions():
+            return importlib_metadata.distributions(path=[str(site)])
+
+    monkeypatch.setattr(environment, '_import_metadata', lambda: Metadata)
+    monkeypatch.setattr(environment, '_site_directories',
+                        lambda: [os.path.join(str(site), '')])
+
+    return SitePackages(site)
+
+
+def test_owner_from_top_level(site_packages):
+    site_packages.install('foo', '1.0', ['foo/__init__.py', 'foo/bar.py'],
+                          top_level=['foo'])
+
+    cache = environment.DistributionCache(None)
+
+    assert cache.distribution_for(site_packages.file('foo/bar.py')) == 'foo'
+    assert cache.distribution_for(__file__) is None
+
+
+def test_owner_from_record(site_packages):
+    """Without top_level.txt, the files listed in RECORD should be used"""
+
+    site_packages.install('single', '1.0', ['single.py'])
+    site_packages.install('package', '1.0', ['package/__init__.py'])
+
+    cache = environment.DistributionCache(None)
+
+    assert cache.distribution_for(
+        site_packages.file('single.py')) == 'single'
+    assert cache.distribution_for(
+        site_packages.file('package/__init__.py')) == 'package'
+
+
+def test_namespace_packages_have_no_owner(site_packages):
+    """Files in a namespace package shared by several distributions can't
+    be attributed to either of them"""
+
+    site_packages.install('ns-a', '1.0', ['ns/a/__init__.py'])
+    site_packages.install('ns-b', '1.0', ['ns/b/__init__.py'],
+                          top_level=['ns'])
+
+    cache = environment.DistributionCache(None)
+
+    assert cache.distribution_for(site_packages.file('ns/a/__init__.py')) \
+        is None
+    assert cache.distribution_for(site_packages.file('ns/b/__init__.py')) \
+        is None
+
+
+def test_version_changes(site_packages):
+    site_packages.install('foo', '1.0', ['foo/__init__.py'])
+    versions = environment.DistributionCache(None).to_json(['foo'])
+
+    assert environment.DistributionCache(versions).is_identical('foo')
+
+    # Reinstalled with different files, but the same version
+    site_packages.uninstall('foo', '1.0')
+    site_packages.install('foo', '1.0', ['foo/__init__.py'],
+                          record_extra='foo/extra.py,,\n')
+
+    assert not environment.DistributionCache(versions).is_identical('foo')
+
+    # Upgraded
+    site_packages.uninstall('foo', '1.0')
+    site_packages.install('foo', '2.0', ['foo/__init__.py'])
+
+    assert not environment.DistributionCache(versions).is_identical('foo')
+
+    # Uninstalled
+    site_packages.uninstall('foo', '2.0')
+
+    assert not environment.DistributionCache(versions).is_identical('foo')
+
+
+def test_upgrade_reruns_dependent_tests(site_packages, run_session,
+                                        tmpdir, monkeypatch):
+    """Upgrading a distribution should only re-run the tests that executed
+    code from it"""
+
+    monkeypatch.chdir(tmpdir)
+
+    site_packages.install('foo', '1.0', ['foo/__init__.py'])
+    source = tmpdir.join('source.py')
+    source.write('x = 1\n')
+
+    tests = {
+        'uses_foo': {
+            str(source): [1],
+            site_packages.file('foo/__init__.py'): [1],
+        },
+        'no_foo': {
+            str(source): [1],
+        },
+    }
+
+    data, executed = run_session('{}', tests)
+    assert executed == ['no_foo', 'uses_foo']
+
+    # Files owned by a distribution should not be tracked line by line
+    assert json.loads(data)['line_cache']['filenames'] == ['source.py']
+
+    data, executed = run_session(data, tests)
+    assert executed == []
+
+    site_packages.uninstall('foo', '1.0')
+    site_packages.install('foo', '2.0', ['foo/__init__.py'])
+
+    data, executed = run_session(data, tests)
+    assert executed == ['uses_foo']
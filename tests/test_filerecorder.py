@@ -0,0 +1,57 @@
+import threading
+
+from covexclude.filerecorder import FileRecorder
+
+
+def test_records_files_read(tmpdir):
+    """Only files read within the root directory should be recorded"""
+
+    read = tmpdir.join('read.txt')
+    read.write('data')
+    written = tmpdir.join('written.txt')
+    source = tmpdir.join('module.py')
+    source.write('')
+
+    recorder = FileRecorder(str(tmpdir))
+    recorder.start()
+
+    with open(str(read), 'r') as f:
+        f.read()
+
+    with open(str(written), 'w') as f:
+        f.write('data')
+
+    with open(str(source), 'r') as f:
+        f.read()
+
+    assert recorder.stop() == [str(read)]
+
+
+def test_ignores_other_threads(tmpdir):
+    """Files opened by other threads while a test is running, such as the
+    driver's prefetch, should not be recorded"""
+
+    read = tmpdir.join('read.txt')
+    read.write('data')
+
+    other_files = [tmpdir.join('other{}.txt'.format(i)) for i in range(20)]
+    for other_file in other_files:
+        other_file.write('data')
+
+    def read_other_files():
+        for other_file in other_files:
+            with open(str(other_file), 'r') as f:
+                f.read()
+
+    recorder = FileRecorder(str(tmpdir))
+    recorder.start()
+
+    thread = threading.Thread(target=read_other_files)
+    thread.start()
+
+    with open(str(read), 'r') as f:
+        f.read()
+
+    thread.join()
+
+    assert recorder.stop() == [str(read)]
@@ -0,0 +1,38 @@
+import json
+
+from covexclude import merge
+
+
+def test_merge_conflicting_ranges(run_session, tmpdir, monkeypatch):
+    """Shards can record different ranges starting at the same line, which
+    should all be kept after merging"""
+
+    monkeypatch.chdir(tmpdir)
+
+    source = tmpdir.join('source.py')
+    source.write('x = 1\ny = 2\nz = 3\n')
+
+    tests = {
+        'long': {str(source): [1, 2]},
+        'short': {str(source): [1]},
+    }
+
+    shard1, executed = run_session('{}', {'long': tests['long']})
+    assert executed == ['long']
+
+    shard2, executed = run_session('{}', {'short': tests['short']})
+    assert executed == ['short']
+
+    merged = merge.merge([shard1, shard2])
+
+    ranges = json.loads(merged)['line_cache']['recorded_ranges']
+    assert sorted((start, end) for _, start, end, _ in ranges) == \
+        [(0, 1), (0, 2)]
+
+    merged, executed = run_session(merged, tests)
+    assert executed == []
+
+    source.write('x = 1\ny = 20\nz = 3\n')
+
+    merged, executed = run_session(merged, tests)
+    assert executed == ['long']
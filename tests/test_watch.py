@@ -0,0 +1,114 @@
+import os
+
+import pytest
+
+from covexclude import cachefile, plugin, watch
+from covexclude.watch import Watcher
+
+SOURCE = '''def f():
+    return 1
+x = 0
+def g():
+    return 2
+y = 0
+'''
+
+
+@pytest.fixture
+def watcher(run_session, tmpdir, monkeypatch):
+    """A watcher on a cache where tests cover different parts of
+    source.py, and one test reads data.txt"""
+
+    monkeypatch.chdir(tmpdir)
+
+    source = str(tmpdir.join('source.py'))
+    tmpdir.join('source.py').write(SOURCE)
+
+    data = str(tmpdir.join('data.txt'))
+    tmpdir.join('data.txt').write('data')
+
+    tests = {
+        'uses_f': {source: [1, 2]},
+        'uses_g': {source: [4, 5]},
+        'uses_data': {},
+    }
+
+    serialized_cache_data, _ = run_session(
+        '{}', tests, opened_files={'uses_data': [data]})
+
+    cache_dir = str(tmpdir.join('.cache'))
+    cachefile.write(cache_dir, plugin.CACHE_KEY, serialized_cache_data)
+
+    watcher = Watcher(cache_dir)
+    watcher.reload_if_changed()
+
+    return watcher
+
+
+def test_affected_items(watcher, tmpdir):
+    """Only the tests covering changed ranges or changed files should be
+    affected"""
+
+    tmpdir.join('source.py').write(SOURCE.replace('return 2', 'return 20'))
+    tmpdir.join('data.txt').write('changed data')
+
+    changed = watcher.changed_files()
+    assert sorted(changed) == [str(tmpdir.join('data.txt')),
+                               str(tmpdir.join('source.py'))]
+
+    assert watcher.affected_items(changed) == set(['uses_g', 'uses_data'])
+
+    assert watcher.changed_files() == []
+
+
+def test_change_outside_of_ranges(watcher, tmpdir):
+    """Changing lines no test covers should not affect any test"""
+
+    tmpdir.join('source.py').write(SOURCE.replace('y = 0', 'y = 10'))
+
+    changed = watcher.changed_files()
+    assert changed == [str(tmpdir.join('source.py'))]
+
+    assert watcher.affected_items(changed) == set()
+
+
+def test_change_before_watching(watcher, tmpdir):
+    """Files changed after the coverage data was recorded but before
+    watching started should count as changed"""
+
+    tmpdir.join('source.py').write(SOURCE.replace('return 1', 'return 10'))
+
+    watcher = Watcher(watcher.cache_dir)
+    watcher.reload_if_changed()
+
+    changed = watcher.changed_files()
+    assert changed == [str(tmpdir.join('source.py'))]
+
+    assert watcher.affected_items(changed) == set(['uses_f'])
+
+    assert watcher.changed_files() == []
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='Requires os.fork')
+def test_run_tests_hands_over_driver(watcher, monkeypatch):
+    """Test runs should reuse the driver, with the hashes already
+    computed, instead of loading the cache again"""
+
+    def main(args):
+        preloaded_driver, fingerprint, hash_backend = \
+            plugin._preloaded_driver
+
+        if (args == ['-x', 'test_source.py'] and
+                preloaded_driver is watcher.driver and
+                fingerprint == watcher.fingerprint and
+                hash_backend == watcher.hash_backend and
+                sorted(preloaded_driver.file_hash_cache.file_hashes) ==
+                sorted(watcher.driver.line_cache.filenames)):
+            return 0
+
+        return 3
+
+    monkeypatch.setattr(watch.pytest, 'main', main)
+
+    assert watcher.run_tests(['test_source.py'], ['-x']) == 0
+    assert plugin._preloaded_driver is None